@@ -155,26 +155,26 @@ _common_rules = (
 
     ########   IP ADDRESSES   ########
     ('IP_literal',   r"\[(?:{IPv6address}|{IPvFuture})\]"),
-    ('IPv6address', (r"(?:                             (?:{h16}:){{6}} {ls32}"
-                     r"|                            :: (?:{h16}:){{5}} {ls32}"
-                     r"| (?:                {h16})? :: (?:{h16}:){{4}} {ls32}"
-                     r"| (?:(?:{h16}:)?     {h16})? :: (?:{h16}:){{3}} {ls32}"
-                     r"| (?:(?:{h16}:){{,2}}{h16})? :: (?:{h16}:){{2}} {ls32}"
-                     r"| (?:(?:{h16}:){{,3}}{h16})? :: (?:{h16}:)      {ls32}"
-                     r"| (?:(?:{h16}:){{,4}}{h16})? ::                 {ls32}"
-                     r"| (?:(?:{h16}:){{,5}}{h16})? ::                 {h16} "
-                     r"| (?:(?:{h16}:){{,6}}{h16})? ::                      )"
+    ('IPv6address', (r"(?:                            (?:{h16}:){6} {ls32}"
+                     r"|                           :: (?:{h16}:){5} {ls32}"
+                     r"| (?:               {h16})? :: (?:{h16}:){4} {ls32}"
+                     r"| (?:(?:{h16}:)?    {h16})? :: (?:{h16}:){3} {ls32}"
+                     r"| (?:(?:{h16}:){,2}{h16})? :: (?:{h16}:){2} {ls32}"
+                     r"| (?:(?:{h16}:){,3}{h16})? :: (?:{h16}:)    {ls32}"
+                     r"| (?:(?:{h16}:){,4}{h16})? ::               {ls32}"
+                     r"| (?:(?:{h16}:){,5}{h16})? ::               {h16} "
+                     r"| (?:(?:{h16}:){,6}{h16})? ::                    )"
                       ).replace(' ', '')),
     ('ls32',         r"(?:{h16}:{h16}|{IPv4address})"),
-    ('h16',          r"{hexdig}{{1,4}}"),
-    ('IPv4address',  r"(?:{dec_octet}\.){{3}}{dec_octet}"),
+    ('h16',          r"{hexdig}{1,4}"),
+    ('IPv4address',  r"(?:{dec_octet}\.){3}{dec_octet}"),
     ('dec_octet',    r"(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)"),
     ('IPvFuture',    r"v{hexdig}+\.(?:{unreserved}|{sub_delims}|:)+"),
 
     ########  CHARACTER CLASSES   ########
     ('unreserved',    r"[a-zA-Z0-9_.~-]"),
     ('reserved',      r"(?:{gen_delims}|{sub_delims})"),
-    ('pct_encoded',   r"%{hexdig}{{2}}"),
+    ('pct_encoded',   r"%{hexdig}{2}"),
     ('gen_delims',    r"[:/?#[\]@]"),
     ('sub_delims',    r"[!$&'()*+,;=]"),
     ('hexdig',        r"[0-9A-Fa-f]"),
@@ -212,7 +212,8 @@ _uri_rules = (
 
     ('segment',       r"{pchar}*"),
     ('segment_nz',    r"{pchar}+"),
-    ('segment_nz_nc', r"(?:{unreserved}|{pct_encoded}|{sub_delims}|@)+"),
+    #: unreserved | sub_delims | @ merged into one class
+    ('segment_nz_nc', r"(?:[a-zA-Z0-9_.~!$&'()*+,;=@-]|{pct_encoded})+"),
 
     ########   QUERY   ########
     ('query',         r"(?:{pchar}|/|\?)*"),
@@ -221,11 +222,24 @@ _uri_rules = (
     ('fragment',      r"(?:{pchar}|/|\?)*"),
 
     ########  CHARACTER CLASSES   ########
-    ('pchar',         r"(?:{unreserved}|{pct_encoded}|{sub_delims}|:|@)"),
+    #: unreserved | sub_delims | : | @ merged into one class, so only
+    #: pct_encoded is left as a true alternative
+    ('pchar',         r"(?:[a-zA-Z0-9_.~!$&'()*+,;=:@-]|{pct_encoded})"),
 
 )
 
 
+#: character ranges of the ucschar rule, kept separate so they can be
+#: fused into larger character classes without an extra alternation
+_ucschar_ranges = (r"\xA0-\uD7FF\uF900-\uFDCF\uFDF0-\uFFEF"
+                   r"\U00010000-\U0001FFFD\U00020000-\U0002FFFD"
+                   r"\U00030000-\U0003FFFD\U00040000-\U0004FFFD"
+                   r"\U00050000-\U0005FFFD\U00060000-\U0006FFFD"
+                   r"\U00070000-\U0007FFFD\U00080000-\U0008FFFD"
+                   r"\U00090000-\U0009FFFD\U000A0000-\U000AFFFD"
+                   r"\U000B0000-\U000BFFFD\U000C0000-\U000CFFFD"
+                   r"\U000D0000-\U000DFFFD\U000E1000-\U000EFFFD")
+
 #: http://tools.ietf.org/html/rfc3987
 #: January 2005
 _iri_rules = (
@@ -260,7 +274,9 @@ _iri_rules = (
     ('ipath_absolute', r"/(?:{isegment_nz}(?:/{isegment})*)?"),
     ('ipath_abempty',  r"(?:/{isegment})*"),
 
-    ('isegment_nz_nc', r"(?:{iunreserved}|{pct_encoded}|{sub_delims}|@)+"),
+    #: iunreserved | sub_delims | @ merged into one class
+    ('isegment_nz_nc', (r"(?:[a-zA-Z0-9_.~!$&'()*+,;=@%s-]"
+                        r"|{pct_encoded})+" % _ucschar_ranges)),
     ('isegment_nz',    r"{ipchar}+"),
     ('isegment',       r"{ipchar}*"),
 
@@ -271,20 +287,23 @@ _iri_rules = (
     ('ifragment', r"(?:{ipchar}|/|\?)*"),
 
     ########   CHARACTER CLASSES   ########
-    ('ipchar',      r"(?:{iunreserved}|{pct_encoded}|{sub_delims}|:|@)"),
-    ('iunreserved', r"(?:[a-zA-Z0-9._~-]|{ucschar})"),
+    #: iunreserved | sub_delims | : | @ merged into one class
+    ('ipchar',      (r"(?:[a-zA-Z0-9_.~!$&'()*+,;=:@%s-]"
+                     r"|{pct_encoded})" % _ucschar_ranges)),
+    ('iunreserved', r"[a-zA-Z0-9._~%s-]" % _ucschar_ranges),
     ('iprivate', r"[\uE000-\uF8FF\U000F0000-\U000FFFFD\U00100000-\U0010FFFD]"),
-    ('ucschar', (r"[\xA0-\uD7FF\uF900-\uFDCF\uFDF0-\uFFEF"
-                 r"\U00010000-\U0001FFFD\U00020000-\U0002FFFD"
-                 r"\U00030000-\U0003FFFD\U00040000-\U0004FFFD"
-                 r"\U00050000-\U0005FFFD\U00060000-\U0006FFFD"
-                 r"\U00070000-\U0007FFFD\U00080000-\U0008FFFD"
-                 r"\U00090000-\U0009FFFD\U000A0000-\U000AFFFD"
-                 r"\U000B0000-\U000BFFFD\U000C0000-\U000CFFFD"
-                 r"\U000D0000-\U000DFFFD\U000E1000-\U000EFFFD]")),
+    ('ucschar', r"[%s]" % _ucschar_ranges),
 
 )
 
+#: all rules in dependency order, references before referents
+_all_rules = _common_rules[::-1] + _uri_rules[::-1] + _iri_rules[::-1]
+
+#: finds {rule_name} references in the rule tables above; quantifier
+#: braces like {6} or {1,4} either do not match or name no known rule,
+#: so they pass through substitution untouched and need no escaping
+_rule_refs_re = _re.compile(r'\{(\w+)\}')
+
 
 def format_patterns(**names):
     r"""Returns a dict of patterns (regular expressions) keyed by
@@ -313,35 +332,39 @@ def format_patterns(**names):
     .. _rule names for IRIs: http://tools.ietf.org/html/rfc3987#section-2.2
     """
     formatted = {}
-    for name, pat in _common_rules[::-1] + _uri_rules[::-1] + _iri_rules[::-1]:
+    for name, pat in _all_rules:
         if name in names:
             n = names[name]
             if callable(n):
                 pat = n(pat)
             else:
                 pat = '(?P<%s>%s)' % (n, pat)
-        formatted[name] = pat.format(**formatted)
+        # rules are already ordered such that every {reference} is
+        # formatted before it is referenced
+        formatted[name] = _rule_refs_re.sub(
+            lambda m: formatted.get(m.group(1), m.group(0)), pat)
     return formatted
 
 
-_GROUP_NAMES_BASE = [
-        'scheme', 'port',
-        'IPv6address', 'IPv4address', 'IPvFuture',
-        'URI_reference',
-        'URI', 'absolute_URI', 'relative_ref', 'relative_part',
-        'authority', 'host', 'userinfo', 'reg_name',
-        'query', 'fragment',
-        'IRI_reference',
-        'IRI', 'absolute_IRI', 'irelative_ref', 'irelative_part',
-        'iauthority', 'ihost', 'iuserinfo', 'ireg_name',
-        'iquery', 'ifragment'
-        ]
-
-DEFAULT_GROUP_NAMES = dict(zip(_GROUP_NAMES_BASE,_GROUP_NAMES_BASE),
-    path_abempty='path', path_absolute='path', path_noscheme='path',
-    path_rootless='path', path_empty='path',
-    ipath_abempty='ipath', ipath_absolute='ipath', ipath_noscheme='ipath',
-    ipath_rootless='ipath', ipath_empty='ipath')
+#: rule name -> capture group name used for the module-level `patterns`
+DEFAULT_GROUP_NAMES = {
+    'scheme': 'scheme', 'port': 'port', 'IPv6address': 'IPv6address',
+    'IPv4address': 'IPv4address', 'IPvFuture': 'IPvFuture',
+    'URI_reference': 'URI_reference', 'URI': 'URI',
+    'absolute_URI': 'absolute_URI', 'relative_ref': 'relative_ref',
+    'relative_part': 'relative_part', 'authority': 'authority',
+    'host': 'host', 'userinfo': 'userinfo', 'reg_name': 'reg_name',
+    'query': 'query', 'fragment': 'fragment',
+    'IRI_reference': 'IRI_reference', 'IRI': 'IRI',
+    'absolute_IRI': 'absolute_IRI', 'irelative_ref': 'irelative_ref',
+    'irelative_part': 'irelative_part', 'iauthority': 'iauthority',
+    'ihost': 'ihost', 'iuserinfo': 'iuserinfo', 'ireg_name': 'ireg_name',
+    'iquery': 'iquery', 'ifragment': 'ifragment', 'path_abempty': 'path',
+    'path_absolute': 'path', 'path_noscheme': 'path',
+    'path_rootless': 'path', 'path_empty': 'path', 'ipath_abempty': 'ipath',
+    'ipath_absolute': 'ipath', 'ipath_noscheme': 'ipath',
+    'ipath_rootless': 'ipath', 'ipath_empty': 'ipath'
+}
 
 #: mapping of rfc3986 / rfc3987 rule names to regular expressions
 patterns = format_patterns(**DEFAULT_GROUP_NAMES)
@@ -355,7 +378,7 @@ patterns_no_names = format_patterns()
 # if not REGEX:
 #: patterns compilable with re
 upatterns_no_names = dict((k, _interpret_unicode_escapes(v)) for k,v
-                          in format_patterns().items())
+                          in patterns_no_names.items())
 
 _bmp = lambda s: _re.sub(r'\\U[0-9A-F]{8}-\\U[0-9A-F]{8}', '', s)
 #: patterns restricted to the basic multilingual plane
@@ -399,16 +422,73 @@ def get_compiled_pattern(rule, flags=0):
         ...     assert get_compiled_pattern(r)
 
     """
-    cache, key = get_compiled_pattern.cache, (rule, flags)
-    if key not in cache:
+    key = (rule, flags)
+    try:
+        return _compiled_pattern_cache[key]
+    except KeyError:
         if NARROW_BUILD:
             pats = bmp_patterns if REGEX else bmp_upatterns_no_names
         else:
             pats = patterns if REGEX else upatterns_no_names
-        p = pats.get(rule) or rule % pats
-        cache[key] = _re.compile(p, flags)
-    return cache[key]
-get_compiled_pattern.cache = {}
+        # an 'in' check, not 'get(rule) or ...': rules expanding to the
+        # empty pattern (path_empty without group names) are falsy
+        p = pats[rule] if rule in pats else rule % pats
+        return _compiled_pattern_cache.setdefault(key, _re.compile(p, flags))
+_compiled_pattern_cache = {}
+
+#: anchored patterns for the rules needed on every `parse` and `resolve`
+#: call, compiled eagerly so the hot paths skip cache lookup and formatting
+_iri_re = get_compiled_pattern('^%(IRI)s$')
+_iri_reference_re = get_compiled_pattern('^%(IRI_reference)s$')
+_iquery_re = get_compiled_pattern('^%(iquery)s$')
+_ifragment_re = get_compiled_pattern('^%(ifragment)s$')
+#: an irelative_ref with neither scheme nor authority: much smaller than
+#: IRI_reference, and the common shape of references fed to `resolve`
+_irelative_noauth_re = get_compiled_pattern(
+    r'^(?P<path>%(ipath_absolute)s|%(ipath_noscheme)s|)'
+    r'(?:\?(?P<query>%(iquery)s))?(?:\#(?P<fragment>%(ifragment)s))?$')
+
+#: rule name -> '^%(rule)s$', so `match` does not rebuild the template
+#: string on every call
+_anchored_templates = dict((name, '^%%(%s)s$' % name) for name in patterns)
+
+
+def _is_ipv6address(string):
+    """Checks `string` against the IPv6address rule in a linear pass.
+
+    Accepts the same language as the nine-branch alternation in
+    `patterns`, but scans invalid input without backtracking: with '::',
+    up to 7 pieces may be present, without it exactly 8 are required (a
+    trailing IPv4address counting for 2). ::
+
+        >>> assert _is_ipv6address('::0:0:0:0:0.0.0.0')
+        >>> assert _is_ipv6address('1:2:3:4:5:6:7:8')
+        >>> assert not _is_ipv6address('1:2:3:4:5:6:7:8:9')
+        >>> assert not _is_ipv6address('1:2:3:4:5:6:7:1.2.3.4')
+        >>> assert not _is_ipv6address('1::3:4::6')
+
+    """
+    head, sep, tail = string.partition('::')
+    if '::' in tail:
+        return False
+    groups = ((head.split(':') if head else [])
+              + (tail.split(':') if tail else []))
+    count = 0
+    for i, group in enumerate(groups):
+        if '.' in group:
+            # an IPv4address piece is only valid in final position, which
+            # excludes anything left of a trailing '::'
+            if (i != len(groups) - 1 or (sep and not tail)
+                    or not match(group, 'IPv4address')):
+                return False
+            count += 2
+        elif match(group, 'h16'):
+            count += 1
+        else:
+            return False
+    if sep:
+        return count <= 7
+    return count == 8
 
 
 def match(string, rule='IRI_reference'):
@@ -421,13 +501,19 @@ def match(string, rule='IRI_reference'):
         >>> assert match('%c7', 'pct_encoded')
 
     """
-    return get_compiled_pattern('^%%(%s)s$' % rule).match(string)
+    if rule == 'IRI_reference':
+        return _iri_reference_re.match(string)
+    if rule == 'IRI':
+        return _iri_re.match(string)
+    if rule == 'IPv6address' and not _is_ipv6address(string):
+        return None
+    return get_compiled_pattern(_anchored_templates[rule]).match(string)
 
 
 #: http://tools.ietf.org/html/rfc3986#appendix-B
 _iri_non_validating_re = _re.compile(
-    r"^((?P<scheme>[^:/?#]+):)?(//(?P<authority>[^/?#]*))?"
-    r"(?P<path>[^?#]*)(\?(?P<query>[^#]*))?(#(?P<fragment>.*))?")
+    r"^(?:(?P<scheme>[^:/?#]+):)?(?://(?P<authority>[^/?#]*))?"
+    r"(?P<path>[^?#]*)(?:\?(?P<query>[^#]*))?(?:#(?P<fragment>.*))?")
 
 REFERENCE_RULES = ('IRI_reference', 'IRI', 'absolute_IRI',
                    'irelative_ref', 'irelative_part',
@@ -465,9 +551,11 @@ def parse(string, rule='IRI_reference'):
     return _i2u(_iri_non_validating_re.match(string).groupdict())
 
 
+_I2U_PAIRS = (('authority', 'iauthority'), ('path', 'ipath'),
+              ('query', 'iquery'), ('fragment', 'ifragment'))
+
 def _i2u(dic):
-    for (name, iname) in [('authority', 'iauthority'), ('path', 'ipath'),
-                          ('query', 'iquery'), ('fragment', 'ifragment')]:
+    for name, iname in _I2U_PAIRS:
         if dic.get(name) is None:
             dic[name] = dic.get(iname)
     return dic
@@ -479,29 +567,80 @@ def compose(scheme=None, authority=None, path=None, query=None, fragment=None,
 
     .. _composed: http://tools.ietf.org/html/rfc3986#section-5.3
     """
-    _i2u(locals())
-    res = ''
+    if authority is None:
+        authority = iauthority
+    if path is None:
+        path = ipath
+    if query is None:
+        query = iquery
+    if fragment is None:
+        fragment = ifragment
+    res = []
     if scheme is not None:
-        res += scheme + ':'
+        res.append(scheme)
+        res.append(':')
     if authority is not None:
-        res += '//' + authority
-    res += path or ''
+        res.append('//')
+        res.append(authority)
+    if path:
+        res.append(path)
     if query is not None:
-        res += '?' + query
+        res.append('?')
+        res.append(query)
     if fragment is not None:
-        res += '#' + fragment
-    return res
-
+        res.append('#')
+        res.append(fragment)
+    return ''.join(res)
 
-_dot_segments = get_compiled_pattern(r'^(?:\.{1,2}(?:/|$))+|(?<=/)\.(?:/|$)')
-_2dots_segments = get_compiled_pattern(r'/?%(segment)s/\.{2}(?:/|$)')
 
 def _remove_dot_segments(path):
-    path =  _dot_segments.sub('', path)
-    c = 1
-    while c:
-        path, c =  _2dots_segments.subn('/', path, 1)
-    return path
+    """Removes_ '.' and '..' segments in a single linear pass.
+
+    .. _Removes: http://tools.ietf.org/html/rfc3986#section-5.2.4
+    """
+    output = []
+    while path:
+        if path.startswith('../'):
+            path = path[3:]
+        elif path.startswith('./') or path.startswith('/./'):
+            path = path[2:]
+        elif path == '/.':
+            path = '/'
+        elif path.startswith('/../'):
+            path = path[3:]
+            if output:
+                output.pop()
+        elif path == '/..':
+            path = '/'
+            if output:
+                output.pop()
+        elif path in ('.', '..'):
+            path = ''
+        else:
+            i = path.find('/', 1)
+            if i < 0:
+                i = len(path)
+            output.append(path[:i])
+            path = path[i:]
+    return ''.join(output)
+
+
+def _parse_base(base):
+    """Parses an IRI, caching the result.
+
+    `resolve` is typically called many times against one base (e.g. all
+    references of a document), so the parts of the last few distinct
+    bases are kept.  Returns a fresh copy so callers may mutate it.
+    """
+    try:
+        B = _base_cache[base]
+    except KeyError:
+        B = parse(base, 'IRI')
+        if len(_base_cache) >= 256:
+            _base_cache.clear()
+        _base_cache[base] = B
+    return dict(B)
+_base_cache = {}
 
 
 def resolve(base, uriref, strict=True, return_parts=False):
@@ -528,18 +667,74 @@ def resolve(base, uriref, strict=True, return_parts=False):
     """
     #base = normalize(base)
     if isinstance(base, basestring):
-        B = parse(base, 'IRI')
+        B = _parse_base(base)
     else:
         B = _i2u(dict(base))
     if not B.get('scheme'):
         raise ValueError('Expected an IRI (with scheme), not %r.' % base)
 
-    if isinstance(uriref, basestring):
-        R = parse(uriref, 'IRI_reference')
-    else:
+    if not isinstance(uriref, basestring):
         R = _i2u(dict(uriref))
-
-    # _last_segment = get_compiled_pattern(r'(?<=^|/)%(segment)s$')
+    elif uriref.startswith('#'):
+        # fragment-only references are common (e.g. when resolving links
+        # within a document) and need not run the full IRI_reference
+        # pattern
+        fragment = uriref[1:]
+        if not _ifragment_re.match(fragment):
+            raise ValueError('%r is not a valid %r.'
+                             % (uriref, 'IRI_reference'))
+        R = {'scheme': None, 'authority': None, 'path': '',
+             'query': None, 'fragment': fragment}
+    elif uriref.startswith('?'):
+        i = uriref.find('#')
+        if i < 0:
+            query, fragment = uriref[1:], None
+        else:
+            query, fragment = uriref[1:i], uriref[i + 1:]
+        if not _iquery_re.match(query) or (
+                fragment is not None and not _ifragment_re.match(fragment)):
+            raise ValueError('%r is not a valid %r.'
+                             % (uriref, 'IRI_reference'))
+        R = {'scheme': None, 'authority': None, 'path': '',
+             'query': query, 'fragment': fragment}
+    else:
+        m = _irelative_noauth_re.match(uriref)
+        if m:
+            R = {'scheme': None, 'authority': None,
+                 'path': m.group('path'), 'query': m.group('query'),
+                 'fragment': m.group('fragment')}
+        else:
+            R = parse(uriref, 'IRI_reference')
+
+    if (not return_parts and R['scheme'] is None
+            and R['authority'] is None):
+        # the common case - a relative reference against an absolute
+        # base - assembled directly, without the T dict and compose()
+        if R['path']:
+            if R['path'].startswith('/'):
+                path = R['path']
+            elif B['authority'] is not None and not B['path']:
+                path = '/' + R['path']
+            else:
+                # merge: http://tools.ietf.org/html/rfc3986#section-5.2.3
+                i = B['path'].rfind('/')
+                path = B['path'][:i + 1] + R['path']
+            query = R['query']
+        else:
+            path = B['path']
+            query = R['query'] if R['query'] is not None else B['query']
+        res = [B['scheme'], ':']
+        if B['authority'] is not None:
+            res.append('//')
+            res.append(B['authority'])
+        res.append(_remove_dot_segments(path))
+        if query is not None:
+            res.append('?')
+            res.append(query)
+        if R['fragment'] is not None:
+            res.append('#')
+            res.append(R['fragment'])
+        return ''.join(res)
 
     if R['scheme'] and (strict or R['scheme'] != B['scheme']):
         T = R
@@ -553,13 +748,14 @@ def resolve(base, uriref, strict=True, return_parts=False):
         else:
             T['authority'] = B['authority']
             if R['path']:
-                if R['path'][:1] == "/":
+                if R['path'].startswith('/'):
                     T['path'] = R['path']
                 elif B['authority'] is not None and not B['path']:
                     T['path'] = '/%s' % R['path']
                 else:
-                    T['path'] = ''.join(B['path'].rpartition('/')[:2]) + R['path']
-                    # _last_segment.sub(R['path'], B['path'])
+                    # merge: http://tools.ietf.org/html/rfc3986#section-5.2.3
+                    i = B['path'].rfind('/')
+                    T['path'] = B['path'][:i + 1] + R['path']
                 T['query'] = R['query']
             else:
                 T['path'] = B['path']